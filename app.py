@@ -1,11 +1,15 @@
 # app.py
 import os
-import time
-from typing import Any, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 import streamlit as st
+import numpy as np
 import pandas as pd
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from io import BytesIO
 
 # ----------------------------
@@ -24,6 +28,47 @@ if "refresh_counter" not in st.session_state:
 # Backend URL (env var or default)
 BACKEND = os.environ.get("BACKEND_URL", "https://business-card-scanner-backend.onrender.com")
 
+# Opt-in: save table edits through POST /bulk_update (only once the backend provides it)
+BULK_UPDATE_ENABLED = os.environ.get("BULK_UPDATE_ENABLED", "").lower() in ("1", "true", "yes")
+
+# Headers for request bodies pre-serialized with orjson
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Columns stored as lists in the backend but shown as comma-separated strings in the UI
+LIST_COLS = frozenset(("phone_numbers", "social_links"))
+
+# Concurrent PATCH requests when saving table edits (must not exceed the session pool size)
+PATCH_WORKERS = 8
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """
+    Shared HTTP session (kept across reruns) so backend calls reuse pooled keep-alive connections.
+    Cached with cache_resource, not cache_data: a Session is an unpicklable singleton.
+    """
+    session = requests.Session()
+    session.headers.update({"User-Agent": "bcs-streamlit/1.0"})
+    # Retry transient failures (e.g. 502s while a Render instance wakes up) inside the pool;
+    # after the last attempt the response is returned as-is so call sites just check it.
+    # POST is deliberately not in allowed_methods: create/upload are not idempotent, so they are
+    # only retried on connect errors (request never sent), never on read errors or status codes.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset({"GET", "PATCH", "DELETE"}),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+SESSION = get_session()
+
+# Resolve the table editor once: data_editor on current Streamlit, experimental_data_editor on older releases
+_data_editor = getattr(st, "data_editor", None) or st.experimental_data_editor
+
 st.title("📇 Business Card OCR → MongoDB")
 st.write("Upload → Extract OCR → Store → Edit → Download")
 
@@ -32,7 +77,9 @@ st.write("Upload → Extract OCR → Store → Edit → Download")
 # ----------------------------
 def to_excel_bytes(df: pd.DataFrame) -> bytes:
     output = BytesIO()
-    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+    # strings_to_urls off: write URLs as plain text like openpyxl did (joined social_links
+    # would otherwise become one broken hyperlink, and long/excess URLs get dropped)
+    with pd.ExcelWriter(output, engine="xlsxwriter", engine_kwargs={"options": {"strings_to_urls": False}}) as writer:
         df.to_excel(writer, index=False)
     return output.getvalue()
 
@@ -41,11 +88,34 @@ def list_to_csv_str(v):
         return ", ".join([str(x) for x in v])
     return v if v is not None else ""
 
+def _join_lists(s: pd.Series) -> pd.Series:
+    """
+    Column-wide list_to_csv_str: join list cells, blank out missing ones, keep other values.
+    """
+    mask = s.map(lambda v: isinstance(v, list))
+    out = s.astype(object)
+    out[mask] = [", ".join(map(str, v)) for v in s[mask]]
+    out[~mask & s.isna()] = ""
+    return out
+
+def _normalize_for_diff(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    String view of an editor frame where None/NaN/"" and surrounding whitespace compare equal,
+    so only real content edits are sent to the backend.
+    """
+    return df.fillna("").astype(str).apply(lambda s: s.str.strip())
+
 def csv_str_to_list(s: str):
     if s is None:
         return []
     return [x.strip() for x in str(s).split(",") if x.strip()]
 
+def _json_body(payload: Any) -> bytes:
+    """
+    Serialize a request body with orjson (numpy scalars from edited DataFrames included).
+    """
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
 def _truncate_name(s: str, length: int = 30) -> str:
     if not s:
         return ""
@@ -53,13 +123,14 @@ def _truncate_name(s: str, length: int = 30) -> str:
 
 def _clean_payload_for_backend(payload: dict) -> dict:
     """
-    Convert csv strings to lists when appropriate and drop empty fields.
+    Convert csv strings to lists for list fields and drop fields that are None
+    (empty strings are kept so edits can clear a field).
     """
     out = {}
     for k, v in payload.items():
         if v is None:
             continue
-        if k in ("phone_numbers", "social_links"):
+        if k in LIST_COLS:
             if isinstance(v, list):
                 out[k] = v
             else:
@@ -68,12 +139,31 @@ def _clean_payload_for_backend(payload: dict) -> dict:
             out[k] = v
     return out
 
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch_all_cards_cached(timeout=20) -> List[Dict[str, Any]]:
+    """
+    Cached GET /all_cards. Raises on failure so errors are never cached.
+    """
+    resp = SESSION.get(f"{BACKEND}/all_cards", timeout=timeout)
+    resp.raise_for_status()
+    data = orjson.loads(resp.content)
+    return data.get("data", [])
+
+@st.cache_data(ttl=60, show_spinner=False)
+def build_all_xlsx(cache_key: Tuple[Tuple[str, str], ...], _df: pd.DataFrame) -> bytes:
+    """
+    Cached "Download All" workbook. Keyed on (id, edited_at) pairs so the Excel build
+    only reruns when the card set changes; _df is excluded from hashing.
+    """
+    return to_excel_bytes(_df)
+
+def invalidate_cards_cache() -> None:
+    _fetch_all_cards_cached.clear()
+    build_all_xlsx.clear()
+
 def fetch_all_cards(timeout=20) -> List[Dict[str, Any]]:
     try:
-        resp = requests.get(f"{BACKEND}/all_cards", timeout=timeout)
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("data", [])
+        return _fetch_all_cards_cached(timeout)
     except Exception as e:
         st.error(f"Failed to fetch cards: {e}")
         return []
@@ -85,8 +175,13 @@ def patch_card(card_id: str, payload: dict, timeout: int = 30) -> Tuple[bool, st
     try:
         # ensure id is string
         card_id = str(card_id)
-        r = requests.patch(f"{BACKEND}/update_card/{card_id}", json=_clean_payload_for_backend(payload), timeout=timeout)
-        if r.status_code in (200, 201):
+        r = SESSION.patch(
+            f"{BACKEND}/update_card/{card_id}",
+            data=_json_body(_clean_payload_for_backend(payload)),
+            headers=JSON_HEADERS,
+            timeout=timeout,
+        )
+        if r.ok:
             return True, "Updated"
         else:
             try:
@@ -100,8 +195,8 @@ def patch_card(card_id: str, payload: dict, timeout: int = 30) -> Tuple[bool, st
 def delete_card(card_id: str, timeout: int = 30) -> Tuple[bool, str]:
     try:
         card_id = str(card_id)
-        r = requests.delete(f"{BACKEND}/delete_card/{card_id}", timeout=timeout)
-        if r.status_code in (200, 204):
+        r = SESSION.delete(f"{BACKEND}/delete_card/{card_id}", timeout=timeout)
+        if r.ok:
             return True, "Deleted"
         else:
             try:
@@ -112,6 +207,44 @@ def delete_card(card_id: str, timeout: int = 30) -> Tuple[bool, str]:
     except Exception as e:
         return False, str(e)
 
+def bulk_update_cards(diffs: List[Tuple[str, dict]], timeout: int = 60) -> Optional[List[Tuple[bool, str]]]:
+    """
+    Send all (card_id, changes) pairs in one POST /bulk_update. Returns one (success, message)
+    per diff, or None when the backend has no bulk endpoint (caller falls back to patch_card).
+
+    Expects {"results": [{"id": ..., "success": bool, "message": str}, ...]}; any card without
+    a reported result is counted as failed rather than assumed updated.
+    """
+    body = [{"id": str(card_id), "changes": _clean_payload_for_backend(changes)} for card_id, changes in diffs]
+    try:
+        r = SESSION.post(f"{BACKEND}/bulk_update", data=_json_body(body), headers=JSON_HEADERS, timeout=timeout)
+    except Exception as e:
+        return [(False, str(e))] * len(diffs)
+    if r.status_code in (404, 405):
+        return None
+    if not r.ok:
+        try:
+            err = r.json()
+        except Exception:
+            err = r.text
+        return [(False, f"Failed: {err}")] * len(diffs)
+
+    try:
+        items = orjson.loads(r.content).get("results") or []
+        by_id = {str(item.get("id")): item for item in items}
+    except Exception as e:
+        return [(False, f"Unreadable bulk response: {e}")] * len(diffs)
+    results = []
+    for card_id, _ in diffs:
+        item = by_id.get(str(card_id))
+        if item is None:
+            results.append((False, "No result returned"))
+        elif item.get("success"):
+            results.append((True, "Updated"))
+        else:
+            results.append((False, f"Failed: {item.get('message', 'unknown error')}"))
+    return results
+
 # ----------------------------
 # Layout: Tabs
 # ----------------------------
@@ -132,27 +265,32 @@ with tab1:
         )
 
         if uploaded_file:
+            # Progress follows real milestones: request sent → backend responded OK → result rendered;
+            # the bar is removed if the upload fails
             progress = st.progress(10)
-            time.sleep(0.08)
-            progress.progress(30)
             with st.spinner("Processing image with OCR and uploading..."):
-                files = {"file": (uploaded_file.name, uploaded_file.getvalue())}
+                # Hand requests the rewound file object (no getvalue() copy) and forward its content type
+                uploaded_file.seek(0)
+                files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type or "application/octet-stream")}
                 try:
-                    response = requests.post(f"{BACKEND}/upload_card", files=files, timeout=120)
-                    response.raise_for_status()
-                except Exception as e:
+                    response = SESSION.post(f"{BACKEND}/upload_card", files=files, timeout=120)
+                except requests.RequestException as e:
                     st.error(f"Failed to reach backend: {e}")
                     response = None
 
-                if response and response.status_code in (200, 201):
-                    res = response.json()
+                if response is not None and response.ok:
+                    progress.progress(70)
+                    res = orjson.loads(response.content)
                     if "data" in res:
+                        invalidate_cards_cache()
                         st.success("Inserted Successfully!")
                         card = res["data"]
                         # hide backend-only fields if present
                         card.pop("field_validations", None)
-                        df = pd.DataFrame([card]).drop(columns=["_id"], errors="ignore")
+                        card.pop("_id", None)
+                        df = pd.DataFrame([card])
                         st.dataframe(df, use_container_width=True)
+                        progress.progress(100)
                         st.download_button(
                             "📥 Download as Excel",
                             to_excel_bytes(df),
@@ -160,8 +298,10 @@ with tab1:
                             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
                         )
                     else:
+                        progress.empty()
                         st.warning("Backend returned success but no data payload.")
                 else:
+                    progress.empty()
                     if response is not None:
                         try:
                             err = response.json()
@@ -170,7 +310,6 @@ with tab1:
                         st.error(f"Upload failed: {err}")
                     else:
                         st.error("Upload failed (no response).")
-            progress.progress(100)
 
     # Preview column (narrow)
     with col_preview:
@@ -211,77 +350,56 @@ with tab1:
                 "more_details": more_details or "",
                 "additional_notes": additional_notes,
             }
-            with st.spinner("Saving..."):
-                try:
-                    r = requests.post(f"{BACKEND}/create_card", json=_clean_payload_for_backend(payload), timeout=30)
-                    r.raise_for_status()
-                except Exception as e:
-                    st.error(f"Failed to reach backend: {e}")
-                    r = None
-
-                if r and r.status_code in (200, 201):
-                    res = r.json()
-                    if "data" in res:
-                        st.success("Inserted Successfully!")
-                        card = res["data"]
-                        card.pop("field_validations", None)
-                        df = pd.DataFrame([card]).drop(columns=["_id"], errors="ignore")
-                        st.dataframe(df, use_container_width=True)
-                        st.download_button(
-                            "📥 Download as Excel",
-                            to_excel_bytes(df),
-                            "business_card_manual.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
-                    else:
-                        st.warning("Created but no data returned.")
-                else:
-                    if r is not None:
-                        try:
-                            err = r.json()
-                        except Exception:
-                            err = r.text
-                        st.error(f"Failed to create card: {err}")
+            cleaned = _clean_payload_for_backend(payload)
+            # Skip the round trip when every field is blank or whitespace-only
+            if not any(v.strip() if isinstance(v, str) else v for v in cleaned.values()):
+                st.warning("Nothing to submit.")
+            else:
+                with st.spinner("Saving..."):
+                    try:
+                        r = SESSION.post(f"{BACKEND}/create_card", data=_json_body(cleaned), headers=JSON_HEADERS, timeout=30)
+                    except requests.RequestException as e:
+                        st.error(f"Failed to reach backend: {e}")
+                        r = None
+
+                    if r is not None and r.ok:
+                        res = orjson.loads(r.content)
+                        if "data" in res:
+                            invalidate_cards_cache()
+                            st.success("Inserted Successfully!")
+                            card = res["data"]
+                            card.pop("field_validations", None)
+                            card.pop("_id", None)
+                            df = pd.DataFrame([card])
+                            st.dataframe(df, use_container_width=True)
+                            st.download_button(
+                                "📥 Download as Excel",
+                                to_excel_bytes(df),
+                                "business_card_manual.xlsx",
+                                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                            )
+                        else:
+                            st.warning("Created but no data returned.")
                     else:
-                        st.error("Failed to create card (no response).")
+                        if r is not None:
+                            try:
+                                err = r.json()
+                            except Exception:
+                                err = r.text
+                            st.error(f"Failed to create card: {err}")
+                        else:
+                            st.error("Failed to create card (no response).")
 
 # ========================================================================
 # TAB 2 — View & Edit All Cards
 # ========================================================================
 with tab2:
     st.markdown("### All business cards")
-    # Top control row
-    top_col1, top_col2 = st.columns([3, 1])
-    with top_col1:
-        st.info("Edit any column → press **Save Changes** to apply edits to the backend.")
-    with top_col2:
-        # Fetch data to calculate download content
-        data = fetch_all_cards()
-        if data:
-            # Remove backend-only field_validations from download data
-            for d in data:
-                d.pop("field_validations", None)
-            df_all_for_download = pd.DataFrame(data)
-            # convert lists to CSV strings for Excel
-            for col in ["phone_numbers", "social_links"]:
-                if col in df_all_for_download.columns:
-                    df_all_for_download[col] = df_all_for_download[col].apply(list_to_csv_str)
-            st.download_button(
-                "📥 Download All as Excel",
-                to_excel_bytes(df_all_for_download.drop(columns=["_id"], errors="ignore")),
-                "all_business_cards.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-        else:
-            st.write("")  # placeholder for alignment
-
-    # Fetch fresh data
+    # Fetch once per render; reused for both the download button and the editor
     with st.spinner("Fetching all business cards..."):
         data = fetch_all_cards()
 
-    if not data:
-        st.warning("No cards found.")
-    else:
+    if data:
         # Normalize into DataFrame for editing/display
         # Remove field_validations from each record to avoid showing it
         for d in data:
@@ -295,18 +413,35 @@ with tab2:
             if c not in df_all.columns:
                 df_all[c] = ""
 
-        # Keep a separate list of ids (do NOT show these to the user)
-        _ids = df_all["_id"].astype(str).tolist()
+        # (id, edited_at) string pairs, built once: the Download All cache key and the id lookup
+        # for Save Changes (ids are NOT shown to the user)
+        card_keys = tuple(df_all[["_id", "edited_at"]].fillna("").astype(str).itertuples(index=False, name=None))
 
-        # Convert list columns to CSV strings for display/editing
-        display_df = df_all.copy()
-        for col in ["phone_numbers", "social_links"]:
-            display_df[col] = display_df[col].apply(list_to_csv_str)
+        # Convert list columns to CSV strings once, in place (nothing needs the raw lists afterwards)
+        for col in LIST_COLS:
+            df_all[col] = _join_lists(df_all[col])
 
-        # Drop the _id column from the displayed dataframe so users don't see it
-        if "_id" in display_df.columns:
-            display_df = display_df.drop(columns=["_id"])
+        # Drop the _id column so users don't see it; shared by the download and the editor
+        display_df = df_all.drop(columns=["_id"])
 
+    # Top control row
+    top_col1, top_col2 = st.columns([3, 1])
+    with top_col1:
+        st.info("Edit any column → press **Save Changes** to apply edits to the backend.")
+    with top_col2:
+        if data:
+            st.download_button(
+                "📥 Download All as Excel",
+                build_all_xlsx(card_keys, display_df),
+                "all_business_cards.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+        else:
+            st.write("")  # placeholder for alignment
+
+    if not data:
+        st.warning("No cards found.")
+    else:
         # Place Save Changes button above the editor
         save_col_left, save_col_mid, save_col_right = st.columns([1, 3, 1])
         with save_col_left:
@@ -316,19 +451,11 @@ with tab2:
         with save_col_right:
             st.write("")  # spacer
 
-        # Use experimental_data_editor if available; fallback to data_editor
-        try:
-            edited = st.experimental_data_editor(
-                display_df,
-                use_container_width=True,
-                num_rows="fixed",    # prevents adding new rows (no duplicates)
-            )
-        except Exception:
-            edited = st.data_editor(
-                display_df,
-                use_container_width=True,
-                num_rows="fixed",
-            )
+        edited = _data_editor(
+            display_df,
+            use_container_width=True,
+            num_rows="fixed",    # prevents adding new rows (no duplicates)
+        )
 
         # -----------------------
         # Persisted drawer implementation using session_state
@@ -398,6 +525,7 @@ with tab2:
                             }
                             success, msg = patch_card(id_str, payload)
                             if success:
+                                invalidate_cards_cache()
                                 st.success("Updated")
                                 # close drawer and trigger rerun via session_state mutation
                                 st.session_state["drawer_open"] = False
@@ -410,6 +538,7 @@ with tab2:
                         if st.button("🗑 Delete card", key=f"drawer-del-{id_str}"):
                             success, msg = delete_card(id_str)
                             if success:
+                                invalidate_cards_cache()
                                 st.success("Deleted")
                                 st.session_state["drawer_open"] = False
                                 st.session_state["drawer_row"] = None
@@ -425,27 +554,34 @@ with tab2:
 
         # When Save Changes clicked, iterate rows and diff against original and send PATCHs (uses patch_card)
         if save_clicked:
+            # Vectorized diff: compare string renderings and only visit rows that actually changed
+            orig_s = _normalize_for_diff(display_df)
+            new_s = _normalize_for_diff(edited)
+            diff = orig_s.ne(new_s).to_numpy()
+            diffs = []
+            for i in np.flatnonzero(diff.any(axis=1)):
+                change_set = {}
+                for col in display_df.columns[diff[i]]:
+                    n = edited.iat[i, edited.columns.get_loc(col)]
+                    n = "" if pd.isna(n) else n
+                    change_set[col] = csv_str_to_list(n) if col in LIST_COLS else n
+                diffs.append((card_keys[i][0], change_set))   # always track correct MongoDB row
+
+            # One bulk request when enabled and supported; otherwise concurrent PATCHes
+            # (workers share the pooled session, pool_maxsize >= max_workers)
             updates = 0
             problems = 0
-            for i in range(len(edited)):
-                orig = display_df.iloc[i]
-                new = edited.iloc[i]
-
-                change_set = {}
-                for col in display_df.columns:
-                    o = "" if pd.isna(orig[col]) else orig[col]
-                    n = "" if pd.isna(new[col]) else new[col]
-
-                    if str(o) != str(n):
-                        if col in ["phone_numbers", "social_links"]:
-                            items = csv_str_to_list(n)
-                            change_set[col] = items
-                        else:
-                            change_set[col] = n
-
-                if change_set:
-                    card_id = _ids[i]   # always track correct MongoDB row
-                    success, msg = patch_card(card_id, change_set)
+            if diffs:
+                results = None
+                if BULK_UPDATE_ENABLED and st.session_state.get("bulk_update_supported", True):
+                    results = bulk_update_cards(diffs)
+                    if results is None:
+                        # remember for this session so later saves skip the failed probe
+                        st.session_state["bulk_update_supported"] = False
+                if results is None:
+                    with ThreadPoolExecutor(max_workers=PATCH_WORKERS) as ex:
+                        results = list(ex.map(lambda p: patch_card(*p), diffs))
+                for (card_id, _), (success, msg) in zip(diffs, results):
                     if success:
                         updates += 1
                     else:
@@ -453,6 +589,7 @@ with tab2:
                         st.error(f"Failed to update {card_id}: {msg}")
 
             if updates > 0:
+                invalidate_cards_cache()
                 st.success(f"✅ Updated {updates} card(s). Refreshing...")
                 # trigger rerun via session_state mutation
                 st.session_state["refresh_counter"] = st.session_state.get("refresh_counter", 0) + 1